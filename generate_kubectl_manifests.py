@@ -1,8 +1,33 @@
 import asyncio
 import aiohttp
+import email.utils
+import functools
 import json
+import math
+import os
+import random
+import re
+import sqlite3
+import sys
+from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # 本地未安装 orjson 时退回标准库
+    orjson = None
+
+try:
+    import aiodns  # noqa: F401  供 aiohttp AsyncResolver 使用
+    from aiohttp.resolver import AsyncResolver
+except ImportError:
+    AsyncResolver = None
+
+try:
+    import uvloop
+except ImportError:  # Windows 等平台没有 uvloop，使用默认事件循环
+    uvloop = None
+
 # ---------------- 配置 ----------------
 BUCKET_DIR = Path("./bucket")
 BUCKET_DIR.mkdir(exist_ok=True)
@@ -20,15 +45,38 @@ ARCHS_BASE = {
 }
 ARM64_START_VERSION = (1, 21, 0)    # >=1.21 开始支持 arm64
 CONVERT_START_VERSION = (1, 22, 0)  # >=1.22 开始有 kubectl-convert.exe
+VERSION_RE = re.compile(r"v?(\d+)\.(\d+)\.(\d+)")
 
 LATEST_VERSION_FILE = "kubectl.json"
+AUTOUPDATE_URL_PREFIX = "https://dl.k8s.io/release/v$version/kubernetes-client-windows-"
+
+# HTTP 连接池：所有请求共用一个 session，复用到 dl.k8s.io 的 TLS 连接
+# 并发量只由 connector 的 limit/limit_per_host 控制，不再额外套 asyncio.Semaphore
+HTTP_LIMIT = 64
+HTTP_LIMIT_PER_HOST = 16
+HTTP_TIMEOUT = 30
+HTTP_HEADERS = {"User-Agent": "python"}
+
+# 429/5xx 及连接错误按指数退避重试
+RETRY_ATTEMPTS = 5
+RETRY_START_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRY_MAX_RETRY_AFTER = 60.0  # Retry-After 的最长等待，避免耗尽 workflow 时间
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 磁盘 HTTP 缓存：带版本号的 release 文件内容不可变，永久缓存；其余 URL 通过 ETag/Last-Modified 重新验证
+HTTP_CACHE_FILE = Path("./.http_cache.sqlite")
+IMMUTABLE_URL_RE = re.compile(r"^https://dl\.k8s\.io/release/v\d+\.\d+\.\d+[^/]*/")
 # --------------------------------------
 
+@functools.lru_cache(maxsize=4096)
 def parse_version(version_str: str):
-    """v1.20.15 -> (1,20,15) 或 v1.20.15-rc.0 -> (1,20,15,0)"""
-    # 移除 -rc 等预发布标识符，用于排序
-    base_version = version_str.split('-')[0]
-    return tuple(map(int, base_version.split(".")))
+    """v1.20.15 -> (1,20,15)，-rc 等预发布标识符被忽略，用于排序"""
+    match = VERSION_RE.match(version_str)
+    if match is None:
+        raise ValueError(f"invalid version: {version_str!r}")
+    major, minor, patch = match.groups()
+    return int(major), int(minor), int(patch)
 
 def need_convert(version: str):
     return parse_version(version) >= CONVERT_START_VERSION
@@ -39,10 +87,105 @@ def archs_for_version(version: str):
         arches["arm64"] = "arm64"
     return arches
 
+class HttpCache:
+    """基于 SQLite 的简单 HTTP 响应缓存"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses"
+                " (url TEXT PRIMARY KEY, etag TEXT, body TEXT NOT NULL, last_modified TEXT)"
+            )
+        return self._conn
+
+    def get(self, url: str):
+        """返回 (etag, last_modified, body)，未缓存时返回 None"""
+        return self._db().execute(
+            "SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+
+    def set(self, url: str, etag, last_modified, body: str):
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, body) VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, body)
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+HTTP_CACHE = HttpCache(HTTP_CACHE_FILE)
+
+
+def is_immutable_url(url: str) -> bool:
+    return IMMUTABLE_URL_RE.match(url) is not None
+
+def retry_after_seconds(value):
+    """解析 Retry-After 头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return max(0.0, seconds) if math.isfinite(seconds) else None
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        # "-0000" 时区会得到 naive datetime，按 UTC 处理
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
 async def fetch_text(session: aiohttp.ClientSession, url: str) -> str:
-    async with session.get(url, timeout=30) as resp:
-        resp.raise_for_status()
-        return await resp.text()
+    cached = HTTP_CACHE.get(url)
+    if cached is not None and is_immutable_url(url):
+        return cached[2]
+
+    # 条件请求：内容未变时服务端返回 304，不重复传输
+    headers = {}
+    if cached is not None:
+        cached_etag, cached_last_modified, _ = cached
+        if cached_etag:
+            headers["If-None-Match"] = cached_etag
+        if cached_last_modified:
+            headers["If-Modified-Since"] = cached_last_modified
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        # 指数退避 + full jitter；429 带 Retry-After 时按服务端要求等待
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_START_DELAY * 2 ** (attempt - 1)))
+        try:
+            async with session.get(url, headers=headers) as resp:
+                if resp.status in RETRY_STATUSES and attempt < RETRY_ATTEMPTS:
+                    print(f"[WARN] {url} returned {resp.status}, retrying ({attempt}/{RETRY_ATTEMPTS})...")
+                    if resp.status == 429:
+                        retry_after = retry_after_seconds(resp.headers.get("Retry-After"))
+                        if retry_after is not None:
+                            delay = min(retry_after, RETRY_MAX_RETRY_AFTER)
+                else:
+                    if resp.status == 304 and cached is not None:
+                        return cached[2]
+                    resp.raise_for_status()
+                    text = await resp.text()
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+                    break
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == RETRY_ATTEMPTS:
+                raise
+            print(f"[WARN] {url} failed: {e!r}, retrying ({attempt}/{RETRY_ATTEMPTS})...")
+        await asyncio.sleep(delay)
+    HTTP_CACHE.set(url, etag, last_modified, text)
+    return text
 
 
 async def fetch_version_file(session: aiohttp.ClientSession, url: str):
@@ -59,28 +202,16 @@ async def fetch_sha256(session: aiohttp.ClientSession, url: str) -> str:
 
 
 async def fetch_github_tags_for_version(session: aiohttp.ClientSession, major_minor: str) -> list:
-    """从 GitHub API 获取指定版本范围的 tags"""
-    url = "https://api.github.com/repos/kubernetes/kubernetes/tags"
+    """从 GitHub API 获取指定版本范围的 tags（只返回匹配前缀的 ref）"""
+    url = f"https://api.github.com/repos/kubernetes/kubernetes/git/matching-refs/tags/v{major_minor}."
+    data = json.loads(await fetch_text(session, url))
+
     tags = []
-    page = 1
-
-    while True:
-        async with session.get(f"{url}?per_page=100&page={page}", timeout=30) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            if not data:
-                break
-
-            # 过滤出匹配的版本
-            for tag in data:
-                tag_name = tag.get("name", "").lstrip("v")
-                if tag_name.startswith(f"{major_minor}."):
-                    tags.append(tag_name)
-
-            page += 1
-            # 限制最多获取 10 页，避免过多请求但确保获取足够版本
-            if page > 10:
-                break
+    for ref in data:
+        tag_name = ref.get("ref", "").removeprefix("refs/tags/v")
+        # 过滤掉 alpha/beta/rc 等预发布版本
+        if "-" not in tag_name:
+            tags.append(tag_name)
 
     return tags
 
@@ -105,27 +236,33 @@ async def generate_manifest_dict(session: aiohttp.ClientSession, version: str):
     if need_convert(version):
         bins.append("kubectl-convert.exe")
 
-    arches = archs_for_version(version)
+    arch_items = list(archs_for_version(version).items())
+    url_prefix = f"https://dl.k8s.io/release/v{version}/kubernetes-client-windows-"
+    # 并发获取所有架构的 sha256
+    results = await asyncio.gather(
+        *[fetch_sha256(session, url_prefix + folder + ".tar.gz.sha256") for _, folder in arch_items],
+        return_exceptions=True
+    )
     arch_dict = {}
-    for arch_name, folder in arches.items():
-        try:
-            hash_256 = await fetch_sha256(session, f"https://dl.k8s.io/release/v{version}/kubernetes-client-windows-{folder}.tar.gz.sha256")
-            arch_dict[arch_name] = {
-                "url": f"https://dl.k8s.io/release/v{version}/kubernetes-client-windows-{folder}.tar.gz",
-                "hash": hash_256
-            }
-            print(f"[INFO] Added {arch_name} architecture for version {version}")
-        except aiohttp.ClientResponseError as e:
-            print(f"[WARN] Skipping {arch_name} architecture for version {version}: {e}")
+    for (arch_name, folder), hash_256 in zip(arch_items, results):
+        if isinstance(hash_256, aiohttp.ClientResponseError):
+            print(f"[WARN] Skipping {arch_name} architecture for version {version}: {hash_256}")
             continue
+        if isinstance(hash_256, BaseException):
+            raise hash_256
+        arch_dict[arch_name] = {
+            "url": url_prefix + folder + ".tar.gz",
+            "hash": hash_256
+        }
+        print(f"[INFO] Added {arch_name} architecture for version {version}")
 
     # 为 autoupdate 创建架构映射，只包含实际可用的架构
     autoupdate_arches = {}
-    for arch_name, folder in arches.items():
+    for arch_name, folder in arch_items:
         # 检查这个架构是否在实际的 arch_dict 中（即是否成功获取了 hash）
         if arch_name in arch_dict:
             autoupdate_arches[arch_name] = {
-                "url": f"https://dl.k8s.io/release/v$version/kubernetes-client-windows-{folder}.tar.gz"
+                "url": AUTOUPDATE_URL_PREFIX + folder + ".tar.gz"
             }
 
     manifest = {
@@ -147,48 +284,106 @@ async def generate_manifest_dict(session: aiohttp.ClientSession, version: str):
     }
     return manifest
 
+def dump_manifest(manifest: dict) -> bytes:
+    """序列化 manifest，orjson 与 json.dumps(indent=2) 输出一致"""
+    if orjson is not None:
+        return orjson.dumps(manifest, option=orjson.OPT_INDENT_2)
+    return json.dumps(manifest, indent=2).encode("utf-8")
+
 def write_manifest(manifest: dict, filename: Path):
-    if filename.exists():
-        old = json.loads(filename.read_text(encoding="utf-8"))
-        if old == manifest:
-            print(f"[SKIP] {filename.name} unchanged.")
-            return
-    filename.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    data = dump_manifest(manifest)
+    # 直接比较字节，无需解析旧文件
+    if filename.exists() and filename.read_bytes() == data:
+        print(f"[SKIP] {filename.name} unchanged.")
+        return
+    # 先写临时文件再原子替换，避免 CI 中断时留下半截文件
+    tmp = filename.with_suffix(".json.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, filename)
     print(f"[OK] Generated manifest: {filename.name}")
 
+def create_resolver():
+    """优先使用 aiodns；不可用时（如 Windows Proactor 事件循环下）退回默认解析器"""
+    if AsyncResolver is None:
+        return None
+    try:
+        return AsyncResolver()
+    except RuntimeError as e:
+        print(f"[WARN] AsyncResolver unavailable, using default resolver: {e}")
+        return None
+
+def create_session() -> aiohttp.ClientSession:
+    """创建带连接池的共享 session"""
+    # 只访问 dl.k8s.io 和 api.github.com 两个域名，DNS 结果整个运行期缓存
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        resolver=create_resolver(),
+        use_dns_cache=True,
+        ttl_dns_cache=3600,
+        keepalive_timeout=75,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=HTTP_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+    )
+
+async def update_latest(session: aiohttp.ClientSession):
+    latest_version = await fetch_version_file(session, "https://dl.k8s.io/release/stable.txt")
+    print(f"[INFO] Latest kubectl version: {latest_version}")
+    # 带版本号的 sha256 由磁盘缓存直接返回，重新生成几乎无网络开销；
+    # 是否改动交给 write_manifest 按字节比较，模板变更也能及时生效
+    latest_manifest = await generate_manifest_dict(session, latest_version)
+    write_manifest(latest_manifest, BUCKET_DIR / LATEST_VERSION_FILE)
+
+async def update_feature(session: aiohttp.ClientSession, major_minor: str):
+    url = f"https://dl.k8s.io/release/stable-{major_minor}.txt"
+    try:
+        latest_feature = await fetch_version_file(session, url)
+        print(f"[INFO] Found stable version for {major_minor}: {latest_feature}")
+    except aiohttp.ClientResponseError as e:
+        print(f"[WARN] Could not fetch stable version for {major_minor} from {url}, trying GitHub API...")
+        try:
+            latest_feature = await get_latest_feature_version_from_github(session, major_minor)
+            print(f"[INFO] Found version for {major_minor} from GitHub: {latest_feature}")
+        except Exception as github_e:
+            print(f"[ERROR] Could not fetch version for {major_minor} from GitHub either: {github_e}, skipping.")
+            return
+
+    try:
+        manifest = await generate_manifest_dict(session, latest_feature)
+        # 检查是否有可用的架构
+        if not manifest["architecture"]:
+            print(f"[WARN] No architectures available for {major_minor} version {latest_feature}, skipping manifest generation.")
+            return
+        write_manifest(manifest, BUCKET_DIR / f"kubectl{major_minor}.json")
+    except Exception as e:
+        print(f"[ERROR] Failed to generate manifest for {major_minor} version {latest_feature}: {e}")
+
 async def main():
-    async with aiohttp.ClientSession() as session:
-        # 1️⃣ 最新版本
-        latest_version = await fetch_version_file(session, "https://dl.k8s.io/release/stable.txt")
-        print(f"[INFO] Latest kubectl version: {latest_version}")
-        latest_manifest = await generate_manifest_dict(session, latest_version)
-        write_manifest(latest_manifest, BUCKET_DIR / LATEST_VERSION_FILE)
-
-        # 2️⃣ 特征版本
-        for major_minor in FEATURE_VERSIONS:
-            url = f"https://dl.k8s.io/release/stable-{major_minor}.txt"
-            try:
-                latest_feature = await fetch_version_file(session, url)
-                print(f"[INFO] Found stable version for {major_minor}: {latest_feature}")
-            except aiohttp.ClientResponseError as e:
-                print(f"[WARN] Could not fetch stable version for {major_minor} from {url}, trying GitHub API...")
-                try:
-                    latest_feature = await get_latest_feature_version_from_github(session, major_minor)
-                    print(f"[INFO] Found version for {major_minor} from GitHub: {latest_feature}")
-                except Exception as github_e:
-                    print(f"[ERROR] Could not fetch version for {major_minor} from GitHub either: {github_e}, skipping.")
-                    continue
-
-            try:
-                manifest = await generate_manifest_dict(session, latest_feature)
-                # 检查是否有可用的架构
-                if not manifest["architecture"]:
-                    print(f"[WARN] No architectures available for {major_minor} version {latest_feature}, skipping manifest generation.")
-                    continue
-                filename = BUCKET_DIR / f"kubectl{major_minor}.json"
-                write_manifest(manifest, filename)
-            except Exception as e:
-                print(f"[ERROR] Failed to generate manifest for {major_minor} version {latest_feature}: {e}")
+    async with create_session() as session:
+        # 最新版本与各特征版本写入不同文件，互不依赖，并发处理
+        results = await asyncio.gather(
+            update_latest(session),
+            *[update_feature(session, major_minor) for major_minor in FEATURE_VERSIONS],
+            return_exceptions=True
+        )
+    # 其余版本处理完后再抛出第一个异常
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        if uvloop is None:
+            asyncio.run(main())
+        elif sys.version_info >= (3, 12):
+            asyncio.run(main(), loop_factory=uvloop.new_event_loop)
+        else:
+            # 3.12 起 uvloop.install() 已弃用
+            uvloop.install()
+            asyncio.run(main())
+    finally:
+        HTTP_CACHE.close()